@@ -4,6 +4,7 @@ Gluten Development Analysis App
 Analyzes g-force data from mixing machine to understand gluten network formation
 """
 
+import os
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -13,41 +14,64 @@ import streamlit as st
 from datetime import datetime
 import seaborn as sns
 
+from gluten_kernels import (col_array, dominant_frequency, load_or_analyze,
+                           lttb_minmax, rolling_std_welford, rolling_median_mad, summarize)
+
 # Set up the Streamlit app
 st.set_page_config(page_title="Gluten Udvikling Analyse", layout="wide")
 
-def load_data(file_path):
-    """Load the CSV data"""
-    df = pd.read_csv(file_path)
+@st.cache_data(show_spinner=False)
+def load_data(file_path, mtime=None):
+    """Load the CSV data (mtime is only part of the cache key)"""
+    df = pd.read_csv(file_path, engine='pyarrow',
+                     usecols=['time', 'gFTotal', 'gFx', 'gFy', 'gFz'])
     return df
 
-def create_spectrogram(data, time, sampling_rate):
+def create_spectrogram(data, sampling_rate):
     """Create spectrogram from g-force data"""
     # Calculate spectrogram
-    frequencies, times, Sxx = spectrogram(data, fs=sampling_rate, 
-                                         window='hann', nperseg=1024, 
-                                         noverlap=512)
+    data32 = np.ascontiguousarray(data, dtype=np.float32)
+    frequencies, times, Sxx = spectrogram(data32, fs=sampling_rate, 
+                                         window='hann', nperseg=256, 
+                                         noverlap=128)
     return frequencies, times, Sxx
 
 def analyze_gluten_development(df):
     """Analyze gluten development patterns"""
-    # Calculate statistics
-    total_time = df['time'].max()
-    mean_gforce = df['gFTotal'].mean()
-    std_gforce = df['gFTotal'].std()
+    g = col_array(df, 'gFTotal')
+    t = col_array(df, 'time')
     
-    # Find peaks in g-force (indicating mixing events)
-    peaks, _ = signal.find_peaks(df['gFTotal'], height=mean_gforce + 0.5*std_gforce)
+    total_time = t.max()
+    sampling_rate = 1.0 / (t[1] - t[0])
+    window_size = int(sampling_rate * 10)  # 10 second windows
     
-    # Analyze frequency content
-    sampling_rate = 1 / (df['time'].iloc[1] - df['time'].iloc[0])
+    # Calculate statistics and find peaks in g-force (indicating mixing
+    # events) in one pass. Peaks must clear a rolling median + 2*MAD
+    # threshold and be at least 100 ms apart
+    med, mad = rolling_median_mad(g, window_size, max(1, int(sampling_rate)))  # 1 s hop
+    mean_gforce, std_gforce, peaks = summarize(g, med + 2.0 * mad,
+                                               max(1, int(0.1 * sampling_rate)))
     
     # Calculate power spectral density
-    freqs, psd = signal.welch(df['gFTotal'], fs=sampling_rate, nperseg=1024)
+    # Decimate to ~20 Hz first; everything we look at is well below 10 Hz
+    dec = max(1, int(sampling_rate // 20))
+    g_dec = signal.decimate(g, dec, ftype='iir', zero_phase=True) if dec > 1 else g
+    fs_dec = sampling_rate / dec
+    # Single precision is plenty for the plots and halves the FFT memory traffic
+    data32 = np.ascontiguousarray(g_dec, dtype=np.float32)
+    # Median averaging is robust to mixing spikes. Segments keep the default
+    # per-segment detrend: the segment means drift, and without it that drift
+    # leaks into the lowest bins and swamps the stirring frequency
+    freqs, psd = signal.welch(data32, fs=fs_dec, nperseg=512, noverlap=256,
+                              average='median')
+    dominant_freq, k_max = dominant_frequency(freqs, psd)  # 0-10 Hz band
+    
+    # Spectrogram (computed once here and reused by the plots)
+    frequencies, times_sg, Sxx = create_spectrogram(data32, fs_dec)
+    n_spec = np.searchsorted(frequencies, 5.0, side='right')  # 0-5 Hz rows
     
     # Detect mixing phases based on g-force variance
-    window_size = int(sampling_rate * 10)  # 10 second windows
-    rolling_std = df['gFTotal'].rolling(window=window_size, center=True).std()
+    rolling_std = rolling_std_welford(g, window_size)
     
     analysis = {
         'total_time': total_time,
@@ -55,45 +79,59 @@ def analyze_gluten_development(df):
         'std_gforce': std_gforce,
         'num_peaks': len(peaks),
         'sampling_rate': sampling_rate,
-        'dominant_freq': freqs[np.argmax(psd)],
-        'rolling_std': rolling_std
+        'dominant_freq': dominant_freq,
+        'k_max': k_max,
+        'rolling_std': rolling_std,
+        'freqs': freqs,
+        'psd': psd,
+        'frequencies': frequencies,
+        'times_sg': times_sg,
+        'Sxx': Sxx,
+        'Sxx_db': 10 * np.log10(Sxx[:n_spec] + 1e-20)
     }
     
     return analysis
 
+@st.cache_data(show_spinner=False)
+def analyze_file(file_path, mtime=None):
+    """Load and analyze the CSV, backed by the on-disk cache (mtime is only part of the cache key)"""
+    return load_or_analyze(load_data(file_path, mtime), file_path,
+                           analyze_gluten_development, 'app')
+
+@st.cache_resource(show_spinner=False)
 def plot_spectrogram(df, analysis):
     """Create spectrogram plot"""
     fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(15, 12))
+    t = col_array(df, 'time')
     
     # Time series plot
-    ax1.plot(df['time'], df['gFTotal'], alpha=0.7, linewidth=0.5)
+    ax1.plot(*lttb_minmax(t, col_array(df, 'gFTotal')), alpha=0.7, linewidth=0.5)
     ax1.set_xlabel('Tid (s)')
     ax1.set_ylabel('Total G-kraft')
     ax1.set_title('G-kraft over tid')
     ax1.grid(True, alpha=0.3)
     
     # Spectrogram
-    frequencies, times, Sxx = create_spectrogram(df['gFTotal'].values, 
-                                                df['time'].values, 
-                                                analysis['sampling_rate'])
-    
-    im = ax2.pcolormesh(times, frequencies[:50], 10 * np.log10(Sxx[:50]), 
-                       shading='gouraud', cmap='viridis')
+    frequencies, times = analysis['frequencies'], analysis['times_sg']
+    n_spec = analysis['Sxx_db'].shape[0]
+    im = ax2.imshow(analysis['Sxx_db'], origin='lower', aspect='auto',
+                    extent=[times[0], times[-1], frequencies[0], frequencies[n_spec - 1]],
+                    cmap='viridis', interpolation='bilinear')
     ax2.set_ylabel('Frekvens (Hz)')
     ax2.set_xlabel('Tid (s)')
     ax2.set_title('Spektrogram (0-5 Hz)')
     plt.colorbar(im, ax=ax2, label='Power/Frequency (dB/Hz)')
     
     # Power spectral density
-    freqs, psd = signal.welch(df['gFTotal'], fs=analysis['sampling_rate'], nperseg=1024)
-    ax3.semilogy(freqs[:100], psd[:100])
+    k_max = analysis['k_max']
+    ax3.semilogy(analysis['freqs'][:k_max], analysis['psd'][:k_max])
     ax3.set_xlabel('Frekvens (Hz)')
     ax3.set_ylabel('Power Spectral Density')
     ax3.set_title('Frekvens spektrum')
     ax3.grid(True, alpha=0.3)
     
     # Gluten development indicator (rolling standard deviation)
-    ax4.plot(df['time'], analysis['rolling_std'], color='red', linewidth=2)
+    ax4.plot(*lttb_minmax(t, analysis['rolling_std']), color='red', linewidth=2)
     ax4.set_xlabel('Tid (s)')
     ax4.set_ylabel('Rullende standardafvigelse')
     ax4.set_title('Gluten udviklings indikator')
@@ -108,10 +146,12 @@ def main():
     
     # Load data
     try:
-        df = load_data('gForce_2025-05-22_12-09-20.csv')
+        file_path = 'gForce_2025-05-22_12-09-20.csv'
+        mtime = os.path.getmtime(file_path)
+        df = load_data(file_path, mtime)
         
         # Perform analysis
-        analysis = analyze_gluten_development(df)
+        analysis = analyze_file(file_path, mtime)
         
         # Display key metrics
         col1, col2, col3, col4 = st.columns(4)
@@ -137,7 +177,12 @@ def main():
         
         # Mixing phases analysis
         st.markdown("### Rørefaser")
-        high_activity_periods = analysis['rolling_std'] > analysis['rolling_std'].quantile(0.75)
+        # 75th percentile via introselect (O(n)) instead of a full sort
+        a = np.asarray(analysis['rolling_std'])
+        valid = a[~np.isnan(a)]
+        k = 3 * valid.size // 4
+        q75 = np.partition(valid, k)[k] if valid.size else np.inf
+        high_activity_periods = a > q75
         
         if high_activity_periods.any():
             st.success(f"Højaktivitets røreperioder detekteret: {high_activity_periods.sum()} datapunkter")
@@ -4,47 +4,93 @@ Simple Gluten Development Analysis
 Creates spectrogram and analysis without Streamlit
 """
 
+import os
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Non-interactive: we only save the figure
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
 from scipy import signal
 from scipy.signal import spectrogram
 import seaborn as sns
+from joblib import Parallel, delayed
+
+from gluten_kernels import (col_array, dominant_frequency, load_or_analyze,
+                           lttb_minmax, rolling_std_welford, rolling_median_mad, summarize,
+                           axis_stats)
 
 # Set up matplotlib for better plots
 plt.style.use('seaborn-v0_8')
 sns.set_palette("husl")
 
+# Files above this size are analyzed in chunks without plotting
+STREAMING_THRESHOLD_BYTES = 512 * 1024**2
+
 def load_data(file_path):
-    """Load the CSV data"""
-    df = pd.read_csv(file_path)
+    """Load the CSV data (cached as Parquet next to the CSV for later runs)"""
+    parquet_path = os.path.splitext(file_path)[0] + '.parquet'
+    if (os.path.exists(parquet_path)
+            and os.path.getmtime(parquet_path) >= os.path.getmtime(file_path)):
+        return pd.read_parquet(parquet_path, engine='pyarrow')
+    
+    df = pd.read_csv(file_path, engine='pyarrow',
+                     usecols=['time', 'gFTotal', 'gFx', 'gFy', 'gFz'])
+    try:
+        df.to_parquet(parquet_path, engine='pyarrow', index=False)
+    except OSError:
+        pass  # Read-only directory, just skip the cache
     return df
 
 def create_spectrogram(data, sampling_rate):
     """Create spectrogram from g-force data"""
-    frequencies, times, Sxx = spectrogram(data, fs=sampling_rate, 
-                                         window='hann', nperseg=1024, 
-                                         noverlap=512)
+    data32 = np.ascontiguousarray(data, dtype=np.float32)
+    frequencies, times, Sxx = spectrogram(data32, fs=sampling_rate, 
+                                         window='hann', nperseg=256, 
+                                         noverlap=128)
     return frequencies, times, Sxx
 
 def analyze_gluten_development(df):
     """Analyze gluten development patterns"""
-    total_time = df['time'].max()
-    mean_gforce = df['gFTotal'].mean()
-    std_gforce = df['gFTotal'].std()
+    g = col_array(df, 'gFTotal')
+    t = col_array(df, 'time')
     
-    # Find peaks in g-force
-    peaks, _ = signal.find_peaks(df['gFTotal'], height=mean_gforce + 0.5*std_gforce)
+    total_time = t.max()
     
     # Calculate sampling rate
-    sampling_rate = 1 / (df['time'].iloc[1] - df['time'].iloc[0])
+    sampling_rate = 1.0 / (t[1] - t[0])
+    window_size = int(sampling_rate * 10)  # 10 second windows
+    
+    # Mean, std and peaks in g-force in one pass. Peaks must clear a rolling
+    # median + 2*MAD threshold and be at least 100 ms apart
+    med, mad = rolling_median_mad(g, window_size, max(1, int(sampling_rate)))  # 1 s hop
+    mean_gforce, std_gforce, peaks = summarize(g, med + 2.0 * mad,
+                                               max(1, int(0.1 * sampling_rate)))
     
     # Power spectral density
-    freqs, psd = signal.welch(df['gFTotal'], fs=sampling_rate, nperseg=1024)
+    # Decimate to ~20 Hz first; everything we look at is well below 10 Hz
+    dec = max(1, int(sampling_rate // 20))
+    g_dec = signal.decimate(g, dec, ftype='iir', zero_phase=True) if dec > 1 else g
+    fs_dec = sampling_rate / dec
+    # Single precision is plenty for the plots and halves the FFT memory traffic
+    data32 = np.ascontiguousarray(g_dec, dtype=np.float32)
+    # Median averaging is robust to mixing spikes. Segments keep the default
+    # per-segment detrend: the segment means drift, and without it that drift
+    # leaks into the lowest bins and swamps the stirring frequency
+    freqs, psd = signal.welch(data32, fs=fs_dec, nperseg=512, noverlap=256,
+                              average='median')
+    dominant_freq, k_max = dominant_frequency(freqs, psd)  # 0-10 Hz band
+    
+    # Spectrogram (computed once here and reused by the plots)
+    frequencies, times_sg, Sxx = create_spectrogram(data32, fs_dec)
+    n_spec = np.searchsorted(frequencies, 5.0, side='right')  # 0-5 Hz rows
     
     # Rolling standard deviation (gluten development indicator)
-    window_size = int(sampling_rate * 10)  # 10 second windows
-    rolling_std = df['gFTotal'].rolling(window=window_size, center=True).std()
+    rolling_std = rolling_std_welford(g, window_size)
+    
+    # Per-axis statistics, one thread per axis
+    axis_mean, axis_std = axis_stats(np.stack([col_array(df, c) for c in ('gFx', 'gFy', 'gFz')], axis=1))
     
     analysis = {
         'total_time': total_time,
@@ -52,24 +98,121 @@ def analyze_gluten_development(df):
         'std_gforce': std_gforce,
         'num_peaks': len(peaks),
         'sampling_rate': sampling_rate,
-        'dominant_freq': freqs[np.argmax(psd)],
+        'dominant_freq': dominant_freq,
+        'k_max': k_max,
         'rolling_std': rolling_std,
+        'axis_mean': axis_mean,
+        'axis_std': axis_std,
         'freqs': freqs,
-        'psd': psd
+        'psd': psd,
+        'frequencies': frequencies,
+        'times_sg': times_sg,
+        'Sxx': Sxx,
+        'Sxx_db': 10 * np.log10(Sxx[:n_spec] + 1e-20)
     }
     
     return analysis
 
+class StatAccumulator:
+    """Online g-force statistics (mean/std, peaks, Welch PSD) fed one chunk at a time"""
+    
+    def __init__(self, nperseg=512, noverlap=256):
+        self.n = 0
+        self.mean = 0.0
+        self.M2 = 0.0
+        self.peaks = 0
+        self.psd_accum = None
+        self.n_segments = 0
+        # Segment sizes are in samples at the ~20 Hz rate the in-memory Welch
+        # runs at, and are scaled to the raw rate once it is known, so both
+        # paths share one frequency grid
+        self._nperseg_dec = nperseg
+        self._noverlap_dec = noverlap
+        self.nperseg = self.step = self.window = None
+        self.sampling_rate = None
+        self.total_time = 0.0
+        self._tail = np.empty(0, dtype=np.float32)  # samples not yet in a full segment
+    
+    def update(self, g, t):
+        """Add a chunk of gFTotal samples g taken at times t"""
+        if self.sampling_rate is None:
+            self.sampling_rate = 1.0 / (t[1] - t[0])
+            dec = max(1, int(self.sampling_rate // 20))
+            self.nperseg = self._nperseg_dec * dec
+            self.step = (self._nperseg_dec - self._noverlap_dec) * dec
+            self.window = signal.get_window('hann', self.nperseg).astype(np.float32)
+        self.total_time = max(self.total_time, t.max())
+        
+        # Chunk mean/std and peaks (chunk edges are treated independently),
+        # merged into the running totals with Chan's parallel Welford update
+        window_size = int(self.sampling_rate * 10)
+        med, mad = rolling_median_mad(g, window_size, max(1, int(self.sampling_rate)))
+        mean_b, std_b, peaks = summarize(g, med + 2.0 * mad,
+                                         max(1, int(0.1 * self.sampling_rate)))
+        n_b = g.size
+        m2_b = std_b**2 * (n_b - 1) if n_b > 1 else 0.0
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.M2 += m2_b + delta**2 * self.n * n_b / n
+        self.n = n
+        self.peaks += peaks.size
+        
+        # Welch: periodograms of every full segment, carrying the remainder over
+        buf = np.concatenate([self._tail, g.astype(np.float32)])
+        if buf.size >= self.nperseg:
+            segs = np.lib.stride_tricks.sliding_window_view(buf, self.nperseg)[::self.step]
+            segs = (segs - segs.mean(axis=1, keepdims=True)) * self.window
+            power = (np.abs(np.fft.rfft(segs, axis=1))**2).sum(axis=0)
+            self.psd_accum = power if self.psd_accum is None else self.psd_accum + power
+            self.n_segments += segs.shape[0]
+            buf = buf[segs.shape[0] * self.step:]
+        self._tail = buf
+    
+    def finalize(self):
+        """Return the summary entries of the analysis dict"""
+        fs = self.sampling_rate
+        freqs = np.fft.rfftfreq(self.nperseg, 1.0 / fs)
+        psd = self.psd_accum / (self.n_segments * fs * (self.window**2).sum())
+        # One-sided density: double everything except DC (and Nyquist)
+        if self.nperseg % 2 == 0:
+            psd[1:-1] *= 2
+        else:
+            psd[1:] *= 2
+        dominant_freq, k_max = dominant_frequency(freqs, psd)  # 0-10 Hz band
+        
+        return {
+            'total_time': self.total_time,
+            'mean_gforce': self.mean,
+            'std_gforce': np.sqrt(self.M2 / (self.n - 1)),
+            'num_peaks': self.peaks,
+            'sampling_rate': fs,
+            'dominant_freq': dominant_freq,
+            'k_max': k_max,
+            'freqs': freqs,
+            'psd': psd
+        }
+
+def analyze_file_streaming(file_path, chunksize=65536):
+    """Analyze a CSV too large for memory; summary statistics only, no plots"""
+    acc = StatAccumulator()
+    for chunk in pd.read_csv(file_path, chunksize=chunksize, usecols=['time', 'gFTotal']):
+        acc.update(col_array(chunk, 'gFTotal'), col_array(chunk, 'time'))
+    return acc.finalize()
+
 def create_analysis_plots(df, analysis):
     """Create comprehensive analysis plots"""
     fig = plt.figure(figsize=(16, 12))
+    t_min = col_array(df, 'time') / 60
     
     # Main title
     fig.suptitle('Gluten Udvikling Analyse - Sesamboller Dej', fontsize=16, fontweight='bold')
     
     # Plot 1: Time series
     ax1 = plt.subplot(3, 3, (1, 2))
-    ax1.plot(df['time']/60, df['gFTotal'], alpha=0.8, linewidth=0.8, color='blue')
+    ax1.plot(*lttb_minmax(t_min, col_array(df, 'gFTotal')), alpha=0.8, linewidth=0.8, color='blue',
+             zorder=-1, rasterized=True)
+    ax1.set_rasterization_zorder(0)
     ax1.set_xlabel('Tid (minutter)')
     ax1.set_ylabel('Total G-kraft')
     ax1.set_title('G-kraft over tid')
@@ -77,9 +220,11 @@ def create_analysis_plots(df, analysis):
     
     # Plot 2: Spectrogram
     ax2 = plt.subplot(3, 3, (4, 5))
-    frequencies, times, Sxx = create_spectrogram(df['gFTotal'].values, analysis['sampling_rate'])
-    im = ax2.pcolormesh(times/60, frequencies[:50], 10 * np.log10(Sxx[:50]), 
-                       shading='gouraud', cmap='viridis')
+    frequencies, times = analysis['frequencies'], analysis['times_sg']
+    n_spec = analysis['Sxx_db'].shape[0]
+    im = ax2.imshow(analysis['Sxx_db'], origin='lower', aspect='auto',
+                    extent=[times[0]/60, times[-1]/60, frequencies[0], frequencies[n_spec - 1]],
+                    cmap='viridis', interpolation='bilinear')
     ax2.set_ylabel('Frekvens (Hz)')
     ax2.set_xlabel('Tid (minutter)')
     ax2.set_title('Spektrogram (0-5 Hz)')
@@ -87,7 +232,8 @@ def create_analysis_plots(df, analysis):
     
     # Plot 3: Power spectral density
     ax3 = plt.subplot(3, 3, 3)
-    ax3.semilogy(analysis['freqs'][:100], analysis['psd'][:100], color='red')
+    k_max = analysis['k_max']
+    ax3.semilogy(analysis['freqs'][:k_max], analysis['psd'][:k_max], color='red')
     ax3.set_xlabel('Frekvens (Hz)')
     ax3.set_ylabel('Power Spectral Density')
     ax3.set_title('Frekvens spektrum')
@@ -95,7 +241,7 @@ def create_analysis_plots(df, analysis):
     
     # Plot 4: Gluten development indicator
     ax4 = plt.subplot(3, 3, 6)
-    ax4.plot(df['time']/60, analysis['rolling_std'], color='green', linewidth=2)
+    ax4.plot(*lttb_minmax(t_min, analysis['rolling_std']), color='green', linewidth=2)
     ax4.set_xlabel('Tid (minutter)')
     ax4.set_ylabel('Rullende std')
     ax4.set_title('Gluten udviklings indikator')
@@ -103,13 +249,20 @@ def create_analysis_plots(df, analysis):
     
     # Plot 5: 3D accelerometer data
     ax5 = plt.subplot(3, 3, (7, 8))
-    ax5.plot(df['time']/60, df['gFx'], alpha=0.7, label='X-akse', linewidth=0.8)
-    ax5.plot(df['time']/60, df['gFy'], alpha=0.7, label='Y-akse', linewidth=0.8)
-    ax5.plot(df['time']/60, df['gFz'], alpha=0.7, label='Z-akse', linewidth=0.8)
+    # All three axes drawn as one collection
+    reduced = Parallel(n_jobs=3, prefer='threads')(
+        delayed(lttb_minmax)(t_min, col_array(df, c)) for c in ('gFx', 'gFy', 'gFz'))
+    segs = [np.column_stack(r) for r in reduced]
+    colors = ['C0', 'C1', 'C2']
+    ax5.add_collection(LineCollection(segs, colors=colors, linewidths=0.8, alpha=0.7,
+                                      zorder=-1, rasterized=True))
+    ax5.set_rasterization_zorder(0)
+    ax5.autoscale_view()
     ax5.set_xlabel('Tid (minutter)')
     ax5.set_ylabel('G-kraft')
     ax5.set_title('3D accelerometer data')
-    ax5.legend()
+    ax5.legend(handles=[Line2D([], [], color=c, alpha=0.7, linewidth=0.8, label=label)
+                        for c, label in zip(colors, ['X-akse', 'Y-akse', 'Z-akse'])])
     ax5.grid(True, alpha=0.3)
     
     # Plot 6: Statistics summary
@@ -119,7 +272,12 @@ def create_analysis_plots(df, analysis):
     # Calculate additional metrics
     total_minutes = analysis['total_time'] / 60
     std_coefficient = analysis['std_gforce'] / analysis['mean_gforce']
-    high_activity_periods = (analysis['rolling_std'] > analysis['rolling_std'].quantile(0.75)).sum()
+    # 75th percentile via introselect (O(n)) instead of a full sort
+    a = np.asarray(analysis['rolling_std'])
+    valid = a[~np.isnan(a)]
+    k = 3 * valid.size // 4
+    q75 = np.partition(valid, k)[k] if valid.size else np.inf
+    high_activity_periods = (a > q75).sum()
     
     # Create text summary
     summary_text = f"""
@@ -162,21 +320,23 @@ VURDERING:
 def main():
     """Main function to run the analysis"""
     try:
-        print("🥖 Indlæser gluten udvikling data...")
-        df = load_data('gForce_2025-05-22_12-09-20.csv')
-        
-        print("📊 Udfører analyse...")
-        analysis = analyze_gluten_development(df)
-        
-        print("📈 Opretter plots...")
-        fig = create_analysis_plots(df, analysis)
-        
-        # Save the plot
-        plt.savefig('gluten_analysis_results.png', dpi=300, bbox_inches='tight')
-        print("💾 Resultater gemt som 'gluten_analysis_results.png'")
-        
-        # Show the plot
-        plt.show()
+        file_path = 'gForce_2025-05-22_12-09-20.csv'
+        if os.path.getsize(file_path) > STREAMING_THRESHOLD_BYTES:
+            print("📊 Stor fil - udfører streaming analyse uden plots...")
+            analysis = analyze_file_streaming(file_path)
+        else:
+            print("🥖 Indlæser gluten udvikling data...")
+            df = load_data(file_path)
+            
+            print("📊 Udfører analyse...")
+            analysis = load_or_analyze(df, file_path, analyze_gluten_development, 'simple')
+            
+            print("📈 Opretter plots...")
+            fig = create_analysis_plots(df, analysis)
+            
+            # Save the plot
+            plt.savefig('gluten_analysis_results.png', dpi=150, bbox_inches='tight')
+            print("💾 Resultater gemt som 'gluten_analysis_results.png'")
         
         # Print summary to console
         print("\n" + "="*50)
@@ -186,6 +346,9 @@ def main():
         print(f"Gennemsnitlig G-kraft: {analysis['mean_gforce']:.3f}")
         print(f"Dominerende frekvens: {analysis['dominant_freq']:.2f} Hz")
         print(f"Antal røre-peaks: {analysis['num_peaks']}")
+        if 'axis_mean' in analysis:
+            for label, m, sd in zip('XYZ', analysis['axis_mean'], analysis['axis_std']):
+                print(f"{label}-akse G-kraft: {m:.3f} ± {sd:.3f}")
         
         # Assessment
         std_coefficient = analysis['std_gforce'] / analysis['mean_gforce']
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Numba kernels and helpers shared by the Streamlit app and the simple script
+Run this file to compile the kernels ahead of time into _gluten_kernels_aot
+"""
+
+import glob
+import os
+import numpy as np
+from numba import njit, prange
+
+# On-disk analysis cache: bump the version whenever analyze_gluten_development
+# (in either script) adds, drops or changes an entry
+ANALYSIS_CACHE_VERSION = 3
+
+def _rolling_std_welford(x, w):
+    """Centered rolling standard deviation (ddof=1) using Welford's recurrence"""
+    n = x.size
+    out = np.empty_like(x)
+    out[:] = np.nan
+    if w < 2 or w > n:
+        return out
+    
+    # Fill the first window
+    mean = 0.0
+    m2 = 0.0
+    for i in range(w):
+        delta = x[i] - mean
+        mean += delta / (i + 1)
+        m2 += delta * (x[i] - mean)
+    
+    # Same centering as pandas rolling(center=True)
+    half = w // 2
+    out[half] = np.sqrt(max(m2, 0.0) / (w - 1))
+    
+    # Slide the window: evict the outgoing sample, then add the incoming one
+    for i in range(w, n):
+        x_out = x[i - w]
+        delta = x_out - mean
+        mean -= delta / (w - 1)
+        m2 -= delta * (x_out - mean)
+        
+        delta = x[i] - mean
+        mean += delta / w
+        m2 += delta * (x[i] - mean)
+        out[i - w + 1 + half] = np.sqrt(max(m2, 0.0) / (w - 1))
+    
+    return out
+
+def _rolling_median_mad(x, w, hop):
+    """Centered rolling median and MAD, evaluated every hop samples and held in between"""
+    n = x.size
+    med = np.empty_like(x)
+    mad = np.empty_like(x)
+    w = max(w, 1)
+    hop = max(hop, 1)
+    half = w // 2
+    dev = np.empty(w)  # scratch buffer for the absolute deviations
+    for start in range(0, n, hop):
+        stop = min(n, start + hop)
+        # Window centered on the block, shrunk at the edges
+        c = (start + stop) // 2
+        lo = max(0, c - half)
+        hi = min(n, c - half + w)
+        win = x[lo:hi]
+        m = np.median(win)
+        k = hi - lo
+        for j in range(k):
+            dev[j] = abs(win[j] - m)
+        med[start:stop] = m
+        mad[start:stop] = np.median(dev[:k])
+    return med, mad
+
+@njit(cache=True)
+def _select_by_distance(x, peaks, distance):
+    """Keep the highest peaks so that no two are closer than distance samples"""
+    k = peaks.size
+    keep = np.ones(k, dtype=np.bool_)
+    # Stable sort, so of equally high peaks the later one wins. find_peaks
+    # leaves that order to an unstable argsort, so on quantised data the kept
+    # set can differ from scipy's at ties
+    order = np.argsort(x[peaks], kind='mergesort')
+    for j in order[::-1]:
+        if not keep[j]:
+            continue
+        m = j - 1
+        while m >= 0 and peaks[j] - peaks[m] < distance:
+            keep[m] = False
+            m -= 1
+        m = j + 1
+        while m < k and peaks[m] - peaks[j] < distance:
+            keep[m] = False
+            m += 1
+    return peaks[keep]
+
+def _summarize(g, thr, distance):
+    """Mean, std (ddof=1) and local maxima at or above thr in a single pass
+    
+    Maxima follow scipy.signal.find_peaks: a flat top counts only if it is
+    followed by a strict fall, and its peak is the middle of the plateau.
+    """
+    n = g.size
+    mean = 0.0
+    m2 = 0.0
+    # Local maxima can't be adjacent, so at most every other sample is one
+    cand = np.empty(n // 2 + 1, dtype=np.int64)
+    k = 0
+    nxt = 1  # first sample the peak scan hasn't consumed yet
+    for i in range(n):
+        delta = g[i] - mean
+        mean += delta / (i + 1)
+        m2 += delta * (g[i] - mean)
+        if i < nxt or i >= n - 1 or not g[i - 1] < g[i]:
+            continue
+        # Walk to the end of a possible plateau
+        j = i + 1
+        while j < n - 1 and g[j] == g[i]:
+            j += 1
+        if g[j] < g[i]:
+            p = (i + j - 1) // 2
+            if g[p] >= thr[p]:
+                cand[k] = p
+                k += 1
+            nxt = j + 1
+    std = np.sqrt(m2 / (n - 1)) if n > 1 else np.nan
+    return mean, std, _select_by_distance(g, cand[:k], distance)
+
+def _axis_stats(g3):
+    """Mean and std (ddof=1) of each column of an (N, 3) array, one axis per thread"""
+    n, n_axes = g3.shape
+    means = np.empty(n_axes)
+    stds = np.empty(n_axes)
+    for j in prange(n_axes):
+        mean = 0.0
+        m2 = 0.0
+        for i in range(n):
+            delta = g3[i, j] - mean
+            mean += delta / (i + 1)
+            m2 += delta * (g3[i, j] - mean)
+        means[j] = mean
+        stds[j] = np.sqrt(m2 / (n - 1)) if n > 1 else np.nan
+    return means, stds
+
+# Prefer the ahead-of-time build; otherwise JIT with an on-disk cache
+try:
+    from _gluten_kernels_aot import rolling_std_welford, rolling_median_mad, summarize
+except ImportError:
+    rolling_std_welford = njit(cache=True, fastmath=True)(_rolling_std_welford)
+    rolling_median_mad = njit(cache=True)(_rolling_median_mad)
+    summarize = njit(cache=True)(_summarize)
+
+# pycc can't build parallel kernels, so this one is always JIT-compiled
+axis_stats = njit(parallel=True, cache=True)(_axis_stats)
+
+def col_array(df, name):
+    """Column as a contiguous float64 array, without copying when it already is one"""
+    return np.ascontiguousarray(df[name].to_numpy(copy=False), dtype=np.float64)
+
+def dominant_frequency(freqs, psd, f_max=10.0):
+    """Strongest frequency below f_max, and the number of PSD bins in that band"""
+    k_max = max(1, np.searchsorted(freqs, f_max))
+    return freqs[np.argmax(psd[:k_max])], k_max
+
+def lttb_minmax(t, y, n_out=4000):
+    """Reduce (t, y) to per-bucket min/max pairs (about n_out points) for plotting"""
+    t = np.asarray(t)
+    y = np.asarray(y, dtype=np.float64)
+    n = y.size
+    if n <= n_out:
+        return t, y
+    
+    # Pad to whole buckets; NaNs only win argmin/argmax if a bucket is all NaN.
+    # The bucket count is recomputed from the rounded-up size so that only the
+    # last bucket is padded and every bucket holds at least one real sample
+    size = -(-n // max(1, n_out // 2))
+    n_buckets = -(-n // size)
+    pad = n_buckets * size - n
+    nan = np.isnan(y)
+    lo = np.pad(np.where(nan, np.inf, y), (0, pad), constant_values=np.inf)
+    hi = np.pad(np.where(nan, -np.inf, y), (0, pad), constant_values=-np.inf)
+    offsets = np.arange(n_buckets) * size
+    idx = np.column_stack([offsets + lo.reshape(n_buckets, size).argmin(axis=1),
+                           offsets + hi.reshape(n_buckets, size).argmax(axis=1)])
+    idx = np.sort(idx, axis=1).ravel()
+    return t[idx], y[idx]
+
+def load_or_analyze(df, file_path, analyze, producer):
+    """Run analyze(df), reusing results saved next to the CSV by an earlier run"""
+    # Key the cache on the CSV's mtime and size so edits invalidate it, and on
+    # the producer and schema version so stale or foreign dicts are never read
+    stem = os.path.splitext(file_path)[0]
+    st_csv = os.stat(file_path)
+    cache_path = (f"{stem}.analysis-{producer}-v{ANALYSIS_CACHE_VERSION}-"
+                  f"{st_csv.st_mtime_ns}-{st_csv.st_size}.npz")
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            return {k: v.item() if v.ndim == 0 else v for k, v in data.items()}
+    
+    analysis = analyze(df)
+    try:
+        np.savez(cache_path, **{k: np.asarray(v) for k, v in analysis.items()})
+    except OSError:
+        return analysis  # Read-only directory, just skip the cache
+    
+    # Remove this producer's caches for older CSV contents or schema versions,
+    # and unversioned caches from before producers were part of the name
+    prefix = glob.escape(stem) + '.analysis-'
+    for stale in glob.glob(f"{prefix}{producer}-*.npz") + glob.glob(f"{prefix}[0-9]*.npz"):
+        if stale != cache_path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    return analysis
+
+def build_aot():
+    """Compile the kernels into the _gluten_kernels_aot extension module"""
+    from numba.pycc import CC
+    
+    cc = CC('_gluten_kernels_aot')
+    cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+    cc.export('rolling_std_welford', 'f8[:](f8[:], i8)')(_rolling_std_welford)
+    cc.export('rolling_median_mad', 'UniTuple(f8[:], 2)(f8[:], i8, i8)')(_rolling_median_mad)
+    cc.export('summarize', 'Tuple((f8, f8, i8[:]))(f8[:], f8[:], i8)')(_summarize)
+    cc.compile()
+
+if __name__ == "__main__":
+    build_aot()
+    print("💾 Kerner kompileret til '_gluten_kernels_aot'")